@@ -5,12 +5,18 @@ Simple script to check which group you're in
 
 import os
 import asyncio
+import functools
 from telegram import Bot
 from dotenv import load_dotenv
 
 load_dotenv()
 
-async def check_current_group():
+@functools.lru_cache(maxsize=None)
+def get_bot(bot_token):
+    """Return a shared Bot per token so repeated checks reuse its HTTP connection pool"""
+    return Bot(token=bot_token)
+
+async def check_current_group(bot=None):
     """Check recent messages to see group IDs"""
     
     bot_token = os.getenv('BOT_TOKEN')
@@ -30,31 +36,34 @@ async def check_current_group():
             print("❌ GROUP_ID not found in environment variables!")
             return
             
-        bot = Bot(token=bot_token)
+        if bot is None:
+            bot = get_bot(bot_token)
         updates = await bot.get_updates(limit=20)
         print(f"📬 Retrieved {len(updates)} recent updates")
         
-        group_messages = []
-        for update in updates:
-            if update.message and update.message.chat.type in ['group', 'supergroup']:
-                group_messages.append({
-                    'group_id': update.message.chat.id,
-                    'group_title': update.message.chat.title,
-                    'message_text': update.message.text[:50] if update.message.text else "No text",
-                    'from_user': update.message.from_user.first_name if update.message.from_user else "Unknown"
-                })
-        
+        # Single pass: keep the first message seen per group and report it immediately
         seen_groups = {}
-        for msg in group_messages:
-            group_id = msg['group_id']
-            if group_id not in seen_groups:
-                seen_groups[group_id] = msg
-                
-                status = "✅ MATCH" if str(group_id) == str(configured_group) else "❌ DIFFERENT"
-                print(f"{status} Group: {msg['group_title']}")
-                print(f"   ID: {group_id}")
-                print(f"   Recent message: \"{msg['message_text']}\" by {msg['from_user']}")
-                print()
+        for update in updates:
+            msg = update.message
+            if not msg or msg.chat.type not in ('group', 'supergroup'):
+                continue
+            group_id = msg.chat.id
+            if group_id in seen_groups:
+                continue
+            
+            seen_groups[group_id] = {
+                'group_id': group_id,
+                'group_title': msg.chat.title,
+                'message_text': msg.text[:50] if msg.text else "No text",
+                'from_user': msg.from_user.first_name if msg.from_user else "Unknown"
+            }
+            info = seen_groups[group_id]
+            
+            status = "✅ MATCH" if str(group_id) == str(configured_group) else "❌ DIFFERENT"
+            print(f"{status} Group: {info['group_title']}")
+            print(f"   ID: {group_id}")
+            print(f"   Recent message: \"{info['message_text']}\" by {info['from_user']}")
+            print()
         
         if not seen_groups:
             print("❌ No recent group messages found.")
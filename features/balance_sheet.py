@@ -4,19 +4,51 @@ Balance sheet module for Ludo Bot Manager
 Handles all balance sheet operations, statistics, and reporting
 """
 
+import asyncio
+import hashlib
 import logging
+import threading
 from datetime import datetime, timedelta
 import calendar
-from collections import defaultdict
+from cachetools import TTLCache
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 
 logger = logging.getLogger(__name__)
 
+# Static balance sheet menu, built once and shared by every callback
+_BALANCE_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("📊 Today", callback_data="balance_today"),
+        InlineKeyboardButton("📅 This Month", callback_data="balance_month")
+    ],
+    [
+        InlineKeyboardButton("📈 Statistics", callback_data="balance_stats"),
+        InlineKeyboardButton("👥 Users", callback_data="balance_users")
+    ],
+    [
+        InlineKeyboardButton("🎮 Games", callback_data="balance_games"),
+        InlineKeyboardButton("💰 Summary", callback_data="balance_summary")
+    ]
+])
+
 class BalanceSheetManager:
     def __init__(self, database, telegram_bot):
         """Initialize balance sheet manager with database and telegram bot dependencies"""
         self.database = database
         self.telegram_bot = telegram_bot
         self.pinned_balance_msg_id = None
+        self._last_pinned_hash = None
+        
+        # Event loop of the Telegram application (see bind_loop); pinned edits must run on it
+        self._loop = None
+        
+        # Rendered transaction reports keyed by period, e.g. ('daily', date); see invalidate()
+        self._sheet_cache = TTLCache(maxsize=256, ttl=60)
+        # invalidate() runs on whichever thread records a transaction (e.g. Pyrogram workers), and
+        # TTLCache mutates itself even on reads, so every access goes through this lock
+        self._cache_lock = threading.Lock()
+        self.database.add_transaction_listener(self.invalidate)
         
         # Load pinned message ID
         self._load_pinned_message_id()
@@ -35,27 +67,84 @@ class BalanceSheetManager:
         try:
             self.database.save_pinned_message_id(message_id)
             self.pinned_balance_msg_id = message_id
+            self._last_pinned_hash = None
             logger.info(f"✅ Saved pinned message ID: {message_id}")
         except Exception as e:
             logger.error(f"❌ Error saving pinned message ID: {e}")
     
-    def get_daily_balance_sheet(self, date=None):
+    def bind_loop(self, loop):
+        """Remember the Telegram application's event loop for schedule_pinned_update"""
+        self._loop = loop
+    
+    def schedule_pinned_update(self, chat_id):
+        """Thread-safe: queue update_pinned_balance_sheet on the Telegram application's loop"""
+        if self._loop is None or self._loop.is_closed():
+            logger.warning("⚠️ Telegram loop not bound yet, skipping pinned balance sheet update")
+            return None
+        return asyncio.run_coroutine_threadsafe(self.update_pinned_balance_sheet(chat_id), self._loop)
+    
+    def _cache_get(self, key):
+        """Thread-safe read of a rendered report (None when missing or expired)"""
+        with self._cache_lock:
+            return self._sheet_cache.get(key)
+    
+    def _cache_set(self, key, value):
+        """Thread-safe store of a rendered report"""
+        with self._cache_lock:
+            self._sheet_cache[key] = value
+    
+    def invalidate(self, transaction=None):
+        """Drop cached reports covering a new transaction (everything when no transaction is given)"""
+        timestamp = (transaction or {}).get('timestamp')
+        with self._cache_lock:
+            if not isinstance(timestamp, datetime):
+                self._sheet_cache.clear()
+                return
+            stale = {('daily', timestamp.date()), ('monthly', timestamp.year, timestamp.month)}
+            for key in list(self._sheet_cache.keys()):
+                # Rolling "last N days" statistics and the shared facets always include a new transaction
+                if key in stale or key[0] in ('overall', 'facets'):
+                    self._sheet_cache.pop(key, None)
+    
+    def _dashboard_facets(self):
+        """Per-type transaction totals for today, this month, last 7 and last 30 days (one cached query)"""
+        now = datetime.utcnow()
+        cache_key = ('facets', now.date())
+        facets = self._cache_get(cache_key)
+        if facets is None:
+            facets = self.database.get_dashboard_facets(now)
+            self._cache_set(cache_key, facets)
+        return facets
+    
+    def get_daily_balance_sheet(self, date=None, stats=None):
         """Get daily balance sheet for a specific date or current date"""
         try:
             if not date:
-                date = datetime.now().date()
+                date = datetime.utcnow().date()
+            
+            cache_key = ('daily', date)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return cached
+            
+            # Today's totals come from the shared dashboard query
+            if stats is None and date == datetime.utcnow().date():
+                stats = self._dashboard_facets()['today']
             
-            # Get start and end of day
+            # Get start of day and start of the next day (half-open range)
             start_of_day = datetime.combine(date, datetime.min.time())
-            end_of_day = datetime.combine(date, datetime.max.time())
+            end_of_day = start_of_day + timedelta(days=1)
             
             # Get transactions for the day
             pipeline = [
                 {
                     '$match': {
-                        'timestamp': {'$gte': start_of_day, '$lte': end_of_day}
+                        'timestamp': {'$gte': start_of_day, '$lt': end_of_day}
                     }
                 },
+                {
+                    '$project': {'_id': 0, 'type': 1, 'amount': 1}
+                },
                 {
                     '$group': {
                         '_id': '$type',
@@ -65,11 +154,11 @@ class BalanceSheetManager:
                 }
             ]
             
-            daily_stats = list(self.database.transactions_collection.aggregate(pipeline))
+            daily_stats = stats if stats is not None else self.database.transactions_collection.aggregate(pipeline)
             
             # Create balance sheet text
-            balance_sheet = f"📊 **Daily Balance Sheet**\n"
-            balance_sheet += f"📅 **Date:** {date.strftime('%Y-%m-%d')}\n\n"
+            parts = [f"📊 **Daily Balance Sheet**\n"]
+            parts.append(f"📅 **Date:** {date.strftime('%Y-%m-%d')}\n\n")
             
             total_income = 0
             total_expense = 0
@@ -81,29 +170,41 @@ class BalanceSheetManager:
                 
                 if amount > 0:
                     total_income += amount
-                    balance_sheet += f"✅ **{tx_type.title()}:** +₹{amount} ({count} transactions)\n"
+                    parts.append(f"✅ **{tx_type.title()}:** +₹{amount} ({count} transactions)\n")
                 else:
                     total_expense += abs(amount)
-                    balance_sheet += f"❌ **{tx_type.title()}:** ₹{amount} ({count} transactions)\n"
+                    parts.append(f"❌ **{tx_type.title()}:** ₹{amount} ({count} transactions)\n")
             
-            balance_sheet += f"\n💰 **Summary:**\n"
-            balance_sheet += f"**Total Income:** ₹{total_income}\n"
-            balance_sheet += f"**Total Expense:** ₹{total_expense}\n"
-            balance_sheet += f"**Net:** ₹{total_income - total_expense}\n"
+            parts.append(f"\n💰 **Summary:**\n")
+            parts.append(f"**Total Income:** ₹{total_income}\n")
+            parts.append(f"**Total Expense:** ₹{total_expense}\n")
+            parts.append(f"**Net:** ₹{total_income - total_expense}\n")
             
+            balance_sheet = "".join(parts)
+            self._cache_set(cache_key, balance_sheet)
             return balance_sheet
             
         except Exception as e:
             logger.error(f"❌ Error getting daily balance sheet: {e}")
             return "❌ Error generating balance sheet"
     
-    def get_monthly_balance_sheet(self, year=None, month=None):
+    def get_monthly_balance_sheet(self, year=None, month=None, stats=None):
         """Get monthly balance sheet for a specific month or current month"""
         try:
             if not year:
-                year = datetime.now().year
+                year = datetime.utcnow().year
             if not month:
-                month = datetime.now().month
+                month = datetime.utcnow().month
+            
+            cache_key = ('monthly', year, month)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return cached
+            
+            # The current month's totals come from the shared dashboard query
+            now = datetime.utcnow()
+            if stats is None and (year, month) == (now.year, now.month):
+                stats = self._dashboard_facets()['month']
             
             # Get start and end of month
             start_date = datetime(year, month, 1)
@@ -119,6 +220,9 @@ class BalanceSheetManager:
                         'timestamp': {'$gte': start_date, '$lt': end_date}
                     }
                 },
+                {
+                    '$project': {'_id': 0, 'type': 1, 'amount': 1}
+                },
                 {
                     '$group': {
                         '_id': '$type',
@@ -128,12 +232,12 @@ class BalanceSheetManager:
                 }
             ]
             
-            monthly_stats = list(self.database.transactions_collection.aggregate(pipeline))
+            monthly_stats = stats if stats is not None else self.database.transactions_collection.aggregate(pipeline)
             
             # Create balance sheet text
             month_name = calendar.month_name[month]
-            balance_sheet = f"📊 **Monthly Balance Sheet**\n"
-            balance_sheet += f"📅 **Period:** {month_name} {year}\n\n"
+            parts = [f"📊 **Monthly Balance Sheet**\n"]
+            parts.append(f"📅 **Period:** {month_name} {year}\n\n")
             
             total_income = 0
             total_expense = 0
@@ -145,43 +249,54 @@ class BalanceSheetManager:
                 
                 if amount > 0:
                     total_income += amount
-                    balance_sheet += f"✅ **{tx_type.title()}:** +₹{amount} ({count} transactions)\n"
+                    parts.append(f"✅ **{tx_type.title()}:** +₹{amount} ({count} transactions)\n")
                 else:
                     total_expense += abs(amount)
-                    balance_sheet += f"❌ **{tx_type.title()}:** ₹{amount} ({count} transactions)\n"
+                    parts.append(f"❌ **{tx_type.title()}:** ₹{amount} ({count} transactions)\n")
             
-            balance_sheet += f"\n💰 **Summary:**\n"
-            balance_sheet += f"**Total Income:** ₹{total_income}\n"
-            balance_sheet += f"**Total Expense:** ₹{total_expense}\n"
-            balance_sheet += f"**Net:** ₹{total_income - total_expense}\n"
+            parts.append(f"\n💰 **Summary:**\n")
+            parts.append(f"**Total Income:** ₹{total_income}\n")
+            parts.append(f"**Total Expense:** ₹{total_expense}\n")
+            parts.append(f"**Net:** ₹{total_income - total_expense}\n")
             
+            balance_sheet = "".join(parts)
+            self._cache_set(cache_key, balance_sheet)
             return balance_sheet
             
         except Exception as e:
             logger.error(f"❌ Error getting monthly balance sheet: {e}")
             return "❌ Error generating monthly balance sheet"
     
-    def get_overall_statistics(self, days=30):
+    def get_overall_statistics(self, days=30, transaction_stats=None):
         """Get overall bot statistics for the last N days"""
         try:
-            stats = self.database.get_overall_stats(days)
+            cache_key = ('overall', days)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return cached
+            
+            # The 7- and 30-day windows are part of the shared dashboard query
+            if transaction_stats is None and days in (7, 30):
+                transaction_stats = self._dashboard_facets()['week' if days == 7 else 'types']
+            
+            stats = self.database.get_overall_stats(days, transaction_stats)
             
             # Create statistics text
-            stats_text = f"📈 **Bot Statistics (Last {days} days)**\n\n"
+            parts = [f"📈 **Bot Statistics (Last {days} days)**\n\n"]
             
             # User statistics
-            stats_text += f"👥 **Users:**\n"
-            stats_text += f"**Total Users:** {stats['total_users']}\n"
-            stats_text += f"**Active Users:** {stats['active_users']}\n\n"
+            parts.append(f"👥 **Users:**\n")
+            parts.append(f"**Total Users:** {stats['total_users']}\n")
+            parts.append(f"**Active Users:** {stats['active_users']}\n\n")
             
             # Game statistics
-            stats_text += f"🎮 **Games:**\n"
-            stats_text += f"**Total Games:** {stats['total_games']}\n"
-            stats_text += f"**Active Games:** {stats['active_games']}\n"
-            stats_text += f"**Completed Games:** {stats['completed_games']}\n\n"
+            parts.append(f"🎮 **Games:**\n")
+            parts.append(f"**Total Games:** {stats['total_games']}\n")
+            parts.append(f"**Active Games:** {stats['active_games']}\n")
+            parts.append(f"**Completed Games:** {stats['completed_games']}\n\n")
             
             # Transaction statistics
-            stats_text += f"💰 **Transactions:**\n"
+            parts.append(f"💰 **Transactions:**\n")
             
             total_income = 0
             total_expense = 0
@@ -193,16 +308,18 @@ class BalanceSheetManager:
                 
                 if amount > 0:
                     total_income += amount
-                    stats_text += f"✅ **{tx_type.title()}:** +₹{amount} ({count} tx)\n"
+                    parts.append(f"✅ **{tx_type.title()}:** +₹{amount} ({count} tx)\n")
                 else:
                     total_expense += abs(amount)
-                    stats_text += f"❌ **{tx_type.title()}:** ₹{amount} ({count} tx)\n"
+                    parts.append(f"❌ **{tx_type.title()}:** ₹{amount} ({count} tx)\n")
             
-            stats_text += f"\n💰 **Financial Summary:**\n"
-            stats_text += f"**Total Income:** ₹{total_income}\n"
-            stats_text += f"**Total Expense:** ₹{total_expense}\n"
-            stats_text += f"**Net:** ₹{total_income - total_expense}\n"
+            parts.append(f"\n💰 **Financial Summary:**\n")
+            parts.append(f"**Total Income:** ₹{total_income}\n")
+            parts.append(f"**Total Expense:** ₹{total_expense}\n")
+            parts.append(f"**Net:** ₹{total_income - total_expense}\n")
             
+            stats_text = "".join(parts)
+            self._cache_set(cache_key, stats_text)
             return stats_text
             
         except Exception as e:
@@ -212,39 +329,39 @@ class BalanceSheetManager:
     def get_user_balance_summary(self):
         """Get summary of all user balances"""
         try:
-            users = self.database.get_all_users()
+            totals = self.database.get_balance_totals()
+            user_count = totals['count']
             
-            if not users:
+            if not user_count:
                 return "❌ No users found"
             
             # Calculate balance statistics
-            total_balance = sum(user.get('balance', 0) for user in users)
-            avg_balance = total_balance / len(users) if users else 0
+            total_balance = totals['total']
+            avg_balance = totals['avg'] or 0
             
-            # Find users with highest and lowest balances
-            sorted_users = sorted(users, key=lambda x: x.get('balance', 0), reverse=True)
-            top_users = sorted_users[:5]
-            bottom_users = sorted_users[-5:] if len(sorted_users) >= 5 else sorted_users
+            # Find users with highest and lowest balances (lowest listed highest-first)
+            top_users = self.database.get_users_by_balance(5)
+            bottom_users = self.database.get_users_by_balance(5, descending=False)[::-1]
             
-            summary = f"💰 **User Balance Summary**\n\n"
-            summary += f"**Total Users:** {len(users)}\n"
-            summary += f"**Total Balance:** ₹{total_balance}\n"
-            summary += f"**Average Balance:** ₹{avg_balance:.2f}\n\n"
+            parts = [f"💰 **User Balance Summary**\n\n"]
+            parts.append(f"**Total Users:** {user_count}\n")
+            parts.append(f"**Total Balance:** ₹{total_balance}\n")
+            parts.append(f"**Average Balance:** ₹{avg_balance:.2f}\n\n")
             
             # Top users
-            summary += f"🏆 **Top 5 Users:**\n"
+            parts.append(f"🏆 **Top 5 Users:**\n")
             for i, user in enumerate(top_users, 1):
                 username = user.get('username', 'Unknown')
                 balance = user.get('balance', 0)
-                summary += f"{i}. @{username}: ₹{balance}\n"
+                parts.append(f"{i}. @{username}: ₹{balance}\n")
             
-            summary += f"\n📉 **Bottom 5 Users:**\n"
+            parts.append(f"\n📉 **Bottom 5 Users:**\n")
             for i, user in enumerate(bottom_users, 1):
                 username = user.get('username', 'Unknown')
                 balance = user.get('balance', 0)
-                summary += f"{i}. @{username}: ₹{balance}\n"
+                parts.append(f"{i}. @{username}: ₹{balance}\n")
             
-            return summary
+            return "".join(parts)
             
         except Exception as e:
             logger.error(f"❌ Error getting user balance summary: {e}")
@@ -253,9 +370,9 @@ class BalanceSheetManager:
     def get_game_statistics(self, days=30):
         """Get game statistics for the last N days"""
         try:
-            start_date = datetime.now() - timedelta(days=days)
+            start_date = datetime.utcnow() - timedelta(days=days)
             
-            # Get games created in the last N days
+            # Status totals and the daily creation trend share one $match via $facet
             pipeline = [
                 {
                     '$match': {
@@ -263,42 +380,45 @@ class BalanceSheetManager:
                     }
                 },
                 {
-                    '$group': {
-                        '_id': '$status',
-                        'count': {'$sum': 1},
-                        'total_amount': {'$sum': '$total_amount'}
-                    }
-                }
-            ]
-            
-            game_stats = list(self.database.games_collection.aggregate(pipeline))
-            
-            # Get daily game creation trend
-            daily_pipeline = [
-                {
-                    '$match': {
-                        'created_at': {'$gte': start_date}
-                    }
-                },
-                {
-                    '$group': {
-                        '_id': {
-                            'year': {'$year': '$created_at'},
-                            'month': {'$month': '$created_at'},
-                            'day': {'$dayOfMonth': '$created_at'}
-                        },
-                        'count': {'$sum': 1}
+                    '$facet': {
+                        'by_status': [
+                            {
+                                '$group': {
+                                    '_id': '$status',
+                                    'count': {'$sum': 1},
+                                    'total_amount': {'$sum': '$total_amount'}
+                                }
+                            }
+                        ],
+                        # Only the last 7 days are shown: take the newest 7 and restore date order below
+                        'by_day': [
+                            {
+                                '$group': {
+                                    '_id': {
+                                        'year': {'$year': '$created_at'},
+                                        'month': {'$month': '$created_at'},
+                                        'day': {'$dayOfMonth': '$created_at'}
+                                    },
+                                    'count': {'$sum': 1}
+                                }
+                            },
+                            {
+                                '$sort': {'_id.year': -1, '_id.month': -1, '_id.day': -1}
+                            },
+                            {
+                                '$limit': 7
+                            }
+                        ]
                     }
-                },
-                {
-                    '$sort': {'_id.year': 1, '_id.month': 1, '_id.day': 1}
                 }
             ]
             
-            daily_stats = list(self.database.games_collection.aggregate(daily_pipeline))
+            result = next(self.database.games_collection.aggregate(pipeline), None) or {}
+            game_stats = result.get('by_status', [])
+            daily_stats = result.get('by_day', [])[::-1]
             
             # Create statistics text
-            stats_text = f"🎮 **Game Statistics (Last {days} days)**\n\n"
+            parts = [f"🎮 **Game Statistics (Last {days} days)**\n\n"]
             
             # Game status summary
             total_games = 0
@@ -312,29 +432,32 @@ class BalanceSheetManager:
                 total_games += count
                 total_amount += amount
                 
-                stats_text += f"**{status.title()} Games:** {count} (₹{amount})\n"
+                parts.append(f"**{status.title()} Games:** {count} (₹{amount})\n")
             
-            stats_text += f"\n💰 **Summary:**\n"
-            stats_text += f"**Total Games:** {total_games}\n"
-            stats_text += f"**Total Amount:** ₹{total_amount}\n"
-            stats_text += f"**Average Game Amount:** ₹{total_amount/total_games:.2f}\n" if total_games > 0 else "**Average Game Amount:** ₹0\n"
+            parts.append(f"\n💰 **Summary:**\n")
+            parts.append(f"**Total Games:** {total_games}\n")
+            parts.append(f"**Total Amount:** ₹{total_amount}\n")
+            if total_games > 0:
+                parts.append(f"**Average Game Amount:** ₹{total_amount/total_games:.2f}\n")
+            else:
+                parts.append("**Average Game Amount:** ₹0\n")
             
             # Daily trend
             if daily_stats:
-                stats_text += f"\n📈 **Daily Trend:**\n"
-                for stat in daily_stats[-7:]:  # Show last 7 days
+                parts.append(f"\n📈 **Daily Trend:**\n")
+                for stat in daily_stats:  # Show last 7 days
                     date_info = stat['_id']
                     count = stat['count']
                     date_str = f"{date_info['year']}-{date_info['month']:02d}-{date_info['day']:02d}"
-                    stats_text += f"{date_str}: {count} games\n"
+                    parts.append(f"{date_str}: {count} games\n")
             
-            return stats_text
+            return "".join(parts)
             
         except Exception as e:
             logger.error(f"❌ Error getting game statistics: {e}")
             return "❌ Error generating game statistics"
     
-    def update_pinned_balance_sheet(self, chat_id):
+    async def update_pinned_balance_sheet(self, chat_id):
         """Update the pinned balance sheet message"""
         try:
             if not self.pinned_balance_msg_id:
@@ -344,14 +467,24 @@ class BalanceSheetManager:
             # Get current balance sheet
             balance_sheet = self.get_daily_balance_sheet()
             
-            # Update the pinned message
-            self.telegram_bot.bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=self.pinned_balance_msg_id,
-                text=balance_sheet,
-                parse_mode='Markdown'
-            )
+            # Skip the edit entirely when the text is unchanged since the last update
+            sheet_hash = hashlib.blake2b(balance_sheet.encode(), digest_size=8).digest()
+            if sheet_hash == self._last_pinned_hash:
+                return True
             
+            # Update the pinned message
+            try:
+                await self.telegram_bot.application.bot.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=self.pinned_balance_msg_id,
+                    text=balance_sheet,
+                    parse_mode='Markdown'
+                )
+            except BadRequest as e:
+                if "not modified" not in str(e).lower():
+                    raise
+            
+            self._last_pinned_hash = sheet_hash
             logger.info("✅ Pinned balance sheet updated successfully")
             return True
             
@@ -361,27 +494,7 @@ class BalanceSheetManager:
     
     def create_balance_sheet_keyboard(self):
         """Create inline keyboard for balance sheet options"""
-        try:
-            keyboard = [
-                [
-                    InlineKeyboardButton("📊 Today", callback_data="balance_today"),
-                    InlineKeyboardButton("📅 This Month", callback_data="balance_month")
-                ],
-                [
-                    InlineKeyboardButton("📈 Statistics", callback_data="balance_stats"),
-                    InlineKeyboardButton("👥 Users", callback_data="balance_users")
-                ],
-                [
-                    InlineKeyboardButton("🎮 Games", callback_data="balance_games"),
-                    InlineKeyboardButton("💰 Summary", callback_data="balance_summary")
-                ]
-            ]
-            
-            return InlineKeyboardMarkup(keyboard)
-            
-        except Exception as e:
-            logger.error(f"❌ Error creating balance sheet keyboard: {e}")
-            return None
+        return _BALANCE_KEYBOARD
     
     def handle_balance_sheet_callback(self, callback_data):
         """Handle balance sheet callback queries"""
@@ -6,16 +6,62 @@ Handles all MongoDB operations including users, games, transactions, and balance
 
 import logging
 from datetime import datetime, timedelta
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import OperationFailure
 from collections import defaultdict
 
 logger = logging.getLogger(__name__)
 
+# All stored timestamps and query ranges are naive UTC (datetime.utcnow()), which is how PyMongo
+# stores and returns naive datetimes; day/month boundaries below are therefore UTC boundaries.
+
+# Default projections: the fields the handlers actually read, without _id (pass projection= to override)
+_USER_PROJECTION = {
+    '_id': 0, 'user_id': 1, 'username': 1, 'first_name': 1, 'last_name': 1,
+    'balance': 1, 'created_at': 1, 'last_updated': 1
+}
+_USER_BALANCE_PROJECTION = {'_id': 0, 'user_id': 1, 'username': 1, 'balance': 1}
+_GAME_PROJECTION = {
+    '_id': 0, 'game_id': 1, 'players': 1, 'players_by_username': 1, 'total_amount': 1, 'status': 1,
+    'created_at': 1, 'chat_id': 1, 'admin_message_id': 1
+}
+# Transaction indexes the stats aggregations pin with hint= (also created by _ensure_indexes), so a
+# missing index fails fast instead of silently falling back to a collection scan
+_TX_TIMESTAMP_INDEX = [('timestamp', -1), ('type', 1), ('amount', 1)]
+_TX_USER_TIMESTAMP_INDEX = [('user_id', 1), ('timestamp', -1)]
+# Indexes earlier versions created that an _ensure_indexes spec now covers (mirrors bot3.py)
+_SUPERSEDED_INDEXES = (
+    ('users', 'balance_1'),
+    ('games', 'status_1_created_at_-1'),
+    ('games', 'admin_message_id_1'),
+    ('transactions', 'timestamp_-1'),
+)
+# bot3.py's running game counters in bot_stats; this module writes the same games collection,
+# so create_game/update_game_status apply the matching $inc (bot3.py rebuilds them at startup)
+_GAME_COUNTERS_ID = 'global'
+
+# Marks a lazily loaded value that has not been read yet (None is a valid cached value)
+_UNLOADED = object()
+
+_TRANSACTION_PROJECTION = {
+    '_id': 0, 'user_id': 1, 'type': 1, 'amount': 1, 'description': 1, 'timestamp': 1, 'game_id': 1
+}
+
 class DatabaseManager:
     def __init__(self, mongo_uri, database_name="ludo_bot"):
         """Initialize database connection and collections"""
         try:
-            self.client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+            # zlib ships with Python (zstd/snappy need extra packages); reads stay on the primary
+            # so a balance read straight after a write never sees a lagging secondary
+            self.client = MongoClient(
+                mongo_uri,
+                serverSelectionTimeoutMS=5000,
+                maxPoolSize=50,
+                minPoolSize=5,
+                compressors='zlib',
+                retryWrites=True,
+                w=1
+            )
             self.db = self.client[database_name]
             
             # Initialize collections
@@ -23,15 +69,63 @@ class DatabaseManager:
             self.games_collection = self.db.games
             self.transactions_collection = self.db.transactions
             self.balance_sheet_collection = self.db.balance_sheet
+            self.stats_collection = self.db.bot_stats
+            
+            # Callbacks run after every create_transaction (e.g. balance sheet cache invalidation)
+            self._transaction_listeners = []
+            
+            # Pinned balance sheet message ID, read from the database at most once (see get_pinned_message_id)
+            self._pinned_msg_cache = _UNLOADED
             
             # Test connection
             self.client.admin.command('ping')
             logger.info("✅ MongoDB connection established successfully")
             
+            self._ensure_indexes()
+            
         except Exception as e:
             logger.error(f"❌ MongoDB connection failed: {e}")
             raise Exception(f"Failed to connect to MongoDB: {e}")
     
+    def _ensure_indexes(self):
+        """Create the indexes behind the lookup, balance sheet and statistics queries (idempotent)"""
+        # Specs shared with bot3.py's _ensure_indexes (same ludo_bot collections) use identical keys
+        index_specs = [
+            # get_user / update_user_balance
+            (self.users_collection, [('user_id', 1)], {'unique': True}),
+            # get_user_by_username; not unique because users without a username store None
+            (self.users_collection, [('username', 1)], {}),
+            # get_overall_stats active-user count
+            (self.users_collection, [('last_updated', -1)], {}),
+            # get_users_by_balance top/bottom lists (an index serves either sort direction)
+            (self.users_collection, [('balance', -1)], {}),
+            (self.games_collection, [('game_id', 1)], {'unique': True}),
+            (self.games_collection, [('admin_message_id', 1), ('chat_id', 1)], {}),
+            # get_active_games / get_expired_games: status equality, created_at range
+            (self.games_collection, [('status', 1), ('created_at', 1)], {}),
+            # get_game_statistics: created_at range across all statuses
+            (self.games_collection, [('created_at', 1)], {}),
+            # get_user_transactions: user_id equality, newest first
+            (self.transactions_collection, _TX_USER_TIMESTAMP_INDEX, {}),
+            (self.transactions_collection, [('game_id', 1)], {}),
+            # Daily/monthly/dashboard aggregations: timestamp range, grouped by type; amount makes it covering
+            (self.transactions_collection, _TX_TIMESTAMP_INDEX, {}),
+            (self.balance_sheet_collection, [('type', 1)], {'unique': True}),
+        ]
+        for collection, keys, options in index_specs:
+            try:
+                collection.create_index(keys, **options)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not create index {keys} on {collection.name}: {e}")
+        for collection_name, index_name in _SUPERSEDED_INDEXES:
+            try:
+                self.db[collection_name].drop_index(index_name)
+                logger.info(f"🗑️ Dropped superseded index {index_name} on {collection_name}")
+            except OperationFailure:
+                pass  # Never created, or already dropped
+            except Exception as e:
+                logger.warning(f"⚠️ Could not drop index {index_name} on {collection_name}: {e}")
+    
     def close_connection(self):
         """Close MongoDB connection"""
         try:
@@ -42,13 +136,13 @@ class DatabaseManager:
             logger.error(f"❌ Error closing MongoDB connection: {e}")
     
     # User Management Methods
-    def get_user(self, user_id):
+    def get_user(self, user_id, projection=_USER_PROJECTION):
         """Get user by user_id"""
-        return self.users_collection.find_one({'user_id': user_id})
+        return self.users_collection.find_one({'user_id': user_id}, projection)
     
-    def get_user_by_username(self, username):
+    def get_user_by_username(self, username, projection=_USER_BALANCE_PROJECTION):
         """Get user by username"""
-        return self.users_collection.find_one({'username': username})
+        return self.users_collection.find_one({'username': username}, projection)
     
     def create_user(self, user_id, username, first_name, last_name=None):
         """Create a new user"""
@@ -58,8 +152,8 @@ class DatabaseManager:
             'first_name': first_name,
             'last_name': last_name,
             'balance': 0,
-            'created_at': datetime.now(),
-            'last_updated': datetime.now()
+            'created_at': datetime.utcnow(),
+            'last_updated': datetime.utcnow()
         }
         result = self.users_collection.insert_one(user_data)
         logger.info(f"✅ Created new user: {username} (ID: {user_id})")
@@ -69,37 +163,85 @@ class DatabaseManager:
         """Update user balance"""
         result = self.users_collection.update_one(
             {'user_id': user_id},
-            {'$set': {'balance': new_balance, 'last_updated': datetime.now()}}
+            {'$set': {'balance': new_balance, 'last_updated': datetime.utcnow()}}
         )
         return result.modified_count > 0
     
-    def get_all_users(self):
+    def increment_user_balance(self, user_id, delta):
+        """Atomically add delta to a user's balance; returns the updated {'user_id', 'balance'} or None"""
+        return self.users_collection.find_one_and_update(
+            {'user_id': user_id},
+            {'$inc': {'balance': delta}, '$set': {'last_updated': datetime.utcnow()}},
+            projection={'_id': 0, 'user_id': 1, 'balance': 1},
+            return_document=ReturnDocument.AFTER
+        )
+    
+    def get_all_users(self, projection=_USER_PROJECTION):
         """Get all users"""
-        return list(self.users_collection.find())
+        return list(self.users_collection.find({}, projection))
+    
+    def get_balance_totals(self):
+        """Get total, average and count of user balances"""
+        pipeline = [
+            {
+                '$group': {
+                    '_id': None,
+                    'total': {'$sum': '$balance'},
+                    'avg': {'$avg': '$balance'},
+                    'count': {'$sum': 1}
+                }
+            }
+        ]
+        
+        for row in self.users_collection.aggregate(pipeline):
+            return row
+        return {'total': 0, 'avg': 0, 'count': 0}
+    
+    def get_users_by_balance(self, limit=5, descending=True):
+        """Get users with the highest (or lowest) balances"""
+        return list(
+            self.users_collection.find({}, {'_id': 0, 'username': 1, 'balance': 1})
+            .sort('balance', -1 if descending else 1)
+            .limit(limit)
+        )
     
     # Game Management Methods
     def create_game(self, game_data):
         """Create a new game"""
+        # Username -> player entry alongside the players list, for O(1) winner lookups
+        game_data.setdefault('players_by_username', {p['username']: p for p in game_data.get('players', [])})
         result = self.games_collection.insert_one(game_data)
         logger.info(f"✅ Created new game: {game_data['game_id']}")
+        self._bump_game_counters({'total_games': 1, f"{game_data.get('status', 'active')}_games": 1})
         return result.inserted_id
     
-    def get_game(self, game_id):
+    def _bump_game_counters(self, inc):
+        """Apply a $inc to the shared bot_stats game counters, logging (not raising) on failure"""
+        inc = {field: n for field, n in inc.items() if n}
+        if not inc:
+            return
+        try:
+            # No upsert: only adjust counters that bot3.py has seeded
+            self.stats_collection.update_one({'_id': _GAME_COUNTERS_ID}, {'$inc': inc})
+        except Exception as e:
+            logger.warning(f"⚠️ Could not update game counters {inc}: {e}")
+    
+    def get_game(self, game_id, projection=_GAME_PROJECTION):
         """Get game by game_id"""
-        return self.games_collection.find_one({'game_id': game_id})
+        return self.games_collection.find_one({'game_id': game_id}, projection)
     
-    def get_game_by_message_id(self, message_id, chat_id):
+    def get_game_by_message_id(self, message_id, chat_id, projection=_GAME_PROJECTION):
         """Get game by admin message ID and chat ID"""
         return self.games_collection.find_one({
             'admin_message_id': message_id,
             'chat_id': chat_id
-        })
+        }, projection)
     
     def update_game_status(self, game_id, status, winner=None, winner_amount=None, admin_fee=None):
         """Update game status and winner information"""
         update_data = {
             'status': status,
-            'completed_at': datetime.now()
+            'completed_at': datetime.utcnow()
         }
         
         if winner:
@@ -109,57 +251,97 @@ class DatabaseManager:
         if admin_fee:
             update_data['admin_fee'] = admin_fee
         
-        result = self.games_collection.update_one(
+        before = self.games_collection.find_one_and_update(
             {'game_id': game_id},
-            {'$set': update_data}
+            {'$set': update_data},
+            projection={'_id': 0, 'status': 1, 'admin_fee': 1}
         )
-        return result.modified_count > 0
+        if before is None:
+            return False
+        
+        # Move the game between the per-status counters and keep total_commission in step
+        inc = defaultdict(int)
+        inc[f"{before.get('status', 'active')}_games"] -= 1
+        inc[f"{status}_games"] += 1
+        if before.get('status') == 'completed':
+            inc['total_commission'] -= before.get('admin_fee') or 0
+        if status == 'completed':
+            inc['total_commission'] += update_data.get('admin_fee', before.get('admin_fee')) or 0
+        self._bump_game_counters(inc)
+        return True
     
-    def get_active_games(self):
+    def get_active_games(self, projection=_GAME_PROJECTION):
         """Get all active games"""
-        return list(self.games_collection.find({'status': 'active'}))
+        return list(self.games_collection.find({'status': 'active'}, projection))
     
-    def get_expired_games(self, expiry_hours=24):
+    def get_expired_games(self, expiry_hours=24, projection=_GAME_PROJECTION):
         """Get games that have expired"""
-        expiry_time = datetime.now() - timedelta(hours=expiry_hours)
+        expiry_time = datetime.utcnow() - timedelta(hours=expiry_hours)
         return list(self.games_collection.find({
             'status': 'active',
             'created_at': {'$lt': expiry_time}
-        }))
+        }, projection))
+    
+    def expire_old_games(self, expiry_hours=24):
+        """Mark every active game older than expiry_hours as expired in one update; returns the count"""
+        now = datetime.utcnow()
+        result = self.games_collection.update_many(
+            {
+                'status': 'active',
+                'created_at': {'$lt': now - timedelta(hours=expiry_hours)}
+            },
+            {'$set': {'status': 'expired', 'completed_at': now}}
+        )
+        if result.modified_count:
+            logger.info(f"⏰ Expired {result.modified_count} old games")
+            self._bump_game_counters({'active_games': -result.modified_count, 'expired_games': result.modified_count})
+        return result.modified_count
     
     # Transaction Methods
+    def add_transaction_listener(self, callback):
+        """Register callback(transaction_data) to run after each transaction is recorded"""
+        self._transaction_listeners.append(callback)
+    
     def create_transaction(self, transaction_data):
         """Create a new transaction"""
         result = self.transactions_collection.insert_one(transaction_data)
         logger.info(f"✅ Created transaction: {transaction_data['type']} - {transaction_data['amount']}")
+        for callback in self._transaction_listeners:
+            try:
+                callback(transaction_data)
+            except Exception as e:
+                logger.error(f"❌ Transaction listener failed: {e}")
         return result.inserted_id
     
-    def get_user_transactions(self, user_id, limit=50):
+    def get_user_transactions(self, user_id, limit=50, projection=_TRANSACTION_PROJECTION):
         """Get transactions for a specific user"""
         return list(self.transactions_collection.find(
-            {'user_id': user_id}
+            {'user_id': user_id}, projection
         ).sort('timestamp', -1).limit(limit))
     
-    def get_transactions_by_game(self, game_id):
+    def get_transactions_by_game(self, game_id, projection=_TRANSACTION_PROJECTION):
         """Get all transactions for a specific game"""
-        return list(self.transactions_collection.find({'game_id': game_id}))
+        return list(self.transactions_collection.find({'game_id': game_id}, projection))
     
     # Balance Sheet Methods
     def get_balance_sheet(self, date=None):
         """Get balance sheet for a specific date or current date"""
         if not date:
-            date = datetime.now().date()
+            date = datetime.utcnow().date()
         
-        # Get start and end of day
+        # Get start of day and start of the next day (half-open range)
         start_of_day = datetime.combine(date, datetime.min.time())
-        end_of_day = datetime.combine(date, datetime.max.time())
+        end_of_day = start_of_day + timedelta(days=1)
         
         pipeline = [
             {
                 '$match': {
-                    'timestamp': {'$gte': start_of_day, '$lte': end_of_day}
+                    'timestamp': {'$gte': start_of_day, '$lt': end_of_day}
                 }
             },
+            {
+                '$project': {'_id': 0, 'type': 1, 'amount': 1}
+            },
             {
                 '$group': {
                     '_id': '$type',
@@ -169,7 +351,7 @@ class DatabaseManager:
             }
         ]
         
-        return list(self.transactions_collection.aggregate(pipeline))
+        return list(self.transactions_collection.aggregate(pipeline, allowDiskUse=False, hint=_TX_TIMESTAMP_INDEX))
     
     def get_monthly_stats(self, year, month):
         """Get monthly statistics"""
@@ -185,6 +367,9 @@ class DatabaseManager:
                     'timestamp': {'$gte': start_date, '$lt': end_date}
                 }
             },
+            {
+                '$project': {'_id': 0, 'type': 1, 'amount': 1}
+            },
             {
                 '$group': {
                     '_id': '$type',
@@ -194,26 +379,34 @@ class DatabaseManager:
             }
         ]
         
-        return list(self.transactions_collection.aggregate(pipeline))
+        return list(self.transactions_collection.aggregate(pipeline, allowDiskUse=False, hint=_TX_TIMESTAMP_INDEX))
     
     def save_pinned_message_id(self, message_id):
         """Save pinned balance sheet message ID"""
         self.balance_sheet_collection.update_one(
             {'type': 'pinned_balance_sheet'},
-            {'$set': {'message_id': message_id, 'updated_at': datetime.now()}},
+            {'$set': {'message_id': message_id, 'updated_at': datetime.utcnow()}},
             upsert=True
         )
+        self._pinned_msg_cache = message_id
         logger.info(f"✅ Saved pinned message ID: {message_id}")
     
     def get_pinned_message_id(self):
         """Get pinned balance sheet message ID"""
-        data = self.balance_sheet_collection.find_one({'type': 'pinned_balance_sheet'})
-        return data.get('message_id') if data else None
+        if self._pinned_msg_cache is not _UNLOADED:
+            return self._pinned_msg_cache
+        
+        data = self.balance_sheet_collection.find_one(
+            {'type': 'pinned_balance_sheet'},
+            {'_id': 0, 'message_id': 1}
+        )
+        self._pinned_msg_cache = data.get('message_id') if data else None
+        return self._pinned_msg_cache
     
     # Statistics Methods
     def get_user_stats(self, user_id, days=30):
         """Get user statistics for the last N days"""
-        start_date = datetime.now() - timedelta(days=days)
+        start_date = datetime.utcnow() - timedelta(days=days)
         
         pipeline = [
             {
@@ -222,6 +415,9 @@ class DatabaseManager:
                     'timestamp': {'$gte': start_date}
                 }
             },
+            {
+                '$project': {'_id': 0, 'type': 1, 'amount': 1}
+            },
             {
                 '$group': {
                     '_id': '$type',
@@ -231,40 +427,117 @@ class DatabaseManager:
             }
         ]
         
-        return list(self.transactions_collection.aggregate(pipeline))
+        return list(self.transactions_collection.aggregate(pipeline, allowDiskUse=False, hint=_TX_USER_TIMESTAMP_INDEX))
     
-    def get_overall_stats(self, days=30):
-        """Get overall bot statistics for the last N days"""
-        start_date = datetime.now() - timedelta(days=days)
+    def get_dashboard_facets(self, now=None):
+        """Get per-type transaction totals for today, this month, last 7 and last 30 days in one query"""
+        if now is None:
+            now = datetime.utcnow()
         
-        # User count
-        total_users = self.users_collection.count_documents({})
-        active_users = self.users_collection.count_documents({
-            'last_updated': {'$gte': start_date}
-        })
+        start_of_day = datetime.combine(now.date(), datetime.min.time())
+        start_of_month = start_of_day.replace(day=1)
+        if start_of_month.month == 12:
+            end_of_month = start_of_month.replace(year=start_of_month.year + 1, month=1)
+        else:
+            end_of_month = start_of_month.replace(month=start_of_month.month + 1)
+        last_30_days = now - timedelta(days=30)
         
-        # Game count
-        total_games = self.games_collection.count_documents({})
-        active_games = self.games_collection.count_documents({'status': 'active'})
-        completed_games = self.games_collection.count_documents({'status': 'completed'})
+        group_by_type = {
+            '$group': {
+                '_id': '$type',
+                'total_amount': {'$sum': '$amount'},
+                'count': {'$sum': 1}
+            }
+        }
         
-        # Transaction stats
         pipeline = [
             {
                 '$match': {
-                    'timestamp': {'$gte': start_date}
+                    'timestamp': {'$gte': min(start_of_month, last_30_days)}
                 }
             },
             {
-                '$group': {
-                    '_id': '$type',
-                    'total_amount': {'$sum': '$amount'},
-                    'count': {'$sum': 1}
+                '$project': {'_id': 0, 'timestamp': 1, 'type': 1, 'amount': 1}
+            },
+            {
+                '$facet': {
+                    'today': [
+                        {'$match': {'timestamp': {'$gte': start_of_day, '$lt': start_of_day + timedelta(days=1)}}},
+                        group_by_type
+                    ],
+                    'month': [
+                        {'$match': {'timestamp': {'$gte': start_of_month, '$lt': end_of_month}}},
+                        group_by_type
+                    ],
+                    'week': [
+                        {'$match': {'timestamp': {'$gte': now - timedelta(days=7)}}},
+                        group_by_type
+                    ],
+                    'types': [
+                        {'$match': {'timestamp': {'$gte': last_30_days}}},
+                        group_by_type
+                    ]
                 }
             }
         ]
         
-        transaction_stats = list(self.transactions_collection.aggregate(pipeline))
+        for row in self.transactions_collection.aggregate(pipeline, allowDiskUse=False, hint=_TX_TIMESTAMP_INDEX):
+            return row
+        return {'today': [], 'month': [], 'week': [], 'types': []}
+    
+    def get_overall_stats(self, days=30, transaction_stats=None):
+        """Get overall bot statistics for the last N days"""
+        start_date = datetime.utcnow() - timedelta(days=days)
+        
+        # User counts (total and recently active) in one round trip
+        user_counts = {'total': 0, 'active': 0}
+        for row in self.users_collection.aggregate([
+            {
+                '$facet': {
+                    'total': [{'$count': 'n'}],
+                    'active': [
+                        {'$match': {'last_updated': {'$gte': start_date}}},
+                        {'$count': 'n'}
+                    ]
+                }
+            }
+        ]):
+            user_counts = {key: value[0]['n'] if value else 0 for key, value in row.items()}
+        total_users = user_counts['total']
+        active_users = user_counts['active']
+        
+        # Game counts per status in one round trip
+        games_by_status = {
+            row['_id']: row['n']
+            for row in self.games_collection.aggregate([
+                {'$group': {'_id': '$status', 'n': {'$sum': 1}}}
+            ])
+        }
+        total_games = sum(games_by_status.values())
+        active_games = games_by_status.get('active', 0)
+        completed_games = games_by_status.get('completed', 0)
+        
+        # Transaction stats (callers may pass them pre-fetched, e.g. from get_dashboard_facets)
+        if transaction_stats is None:
+            pipeline = [
+                {
+                    '$match': {
+                        'timestamp': {'$gte': start_date}
+                    }
+                },
+                {
+                    '$project': {'_id': 0, 'type': 1, 'amount': 1}
+                },
+                {
+                    '$group': {
+                        '_id': '$type',
+                        'total_amount': {'$sum': '$amount'},
+                        'count': {'$sum': 1}
+                    }
+                }
+            ]
+            
+            transaction_stats = list(self.transactions_collection.aggregate(pipeline, allowDiskUse=False, hint=_TX_TIMESTAMP_INDEX))
         
         return {
             'total_users': total_users,
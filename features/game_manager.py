@@ -12,27 +12,35 @@ Register with:
 """
 
 import re
+import threading
 from datetime import datetime
+from cachetools import TTLCache
 from pyrogram import filters
 
-# In-memory storage of active games keyed by message_id
-_games = {}
+# In-memory storage of active games keyed by message_id; abandoned tables expire after a day.
+# Handlers run on Pyrogram's worker threads and TTLCache is not thread-safe, hence the lock.
+_games = TTLCache(maxsize=10_000, ttl=86400)
+_games_lock = threading.Lock()
+
+_AMOUNT_RE = re.compile(r"(\d+)\s*[Ff]ull")
+# One match per table line: a line mentioning "full" (it carries the amount) or the line's first word (a player)
+_TABLE_LINE_RE = re.compile(r"^(?P<full>[^\n]*(?i:full)[^\n]*)|^[^\w\n]*(?P<user>\w+)", re.MULTILINE)
+# "name ✅" or "✅ name", with or without @; the leftmost mark wins
+_WINNER_RE = re.compile(r"@?(\w+)\s*✅|✅\s*@?(\w+)")
 
 
 def extract_game_data_from_message(message_text: str):
-    lines = (message_text or "").strip().split("\n")
     usernames = []
     amount = None
 
-    for line in lines:
-        if "full" in line.lower():
-            match = re.search(r"(\d+)\s*[Ff]ull", line)
-            if match:
-                amount = int(match.group(1))
+    for match in _TABLE_LINE_RE.finditer(message_text or ""):
+        full_line = match.group("full")
+        if full_line is not None:
+            amount_match = _AMOUNT_RE.search(full_line)
+            if amount_match:
+                amount = int(amount_match.group(1))
         else:
-            match = re.search(r"@?(\w+)", line)
-            if match:
-                usernames.append(match.group(1))
+            usernames.append(match.group("user"))
 
     if not usernames or not amount:
         return None
@@ -40,21 +48,14 @@ def extract_game_data_from_message(message_text: str):
     return {
         "players": usernames,
         "amount": amount,
-        "created_at": datetime.now(),
+        "created_at": datetime.utcnow(),
     }
 
 
 def extract_winner_from_edited_message(message_text: str):
-    patterns = [
-        r"@(\w+)\s*✅",
-        r"(\w+)\s*✅",
-        r"✅\s*@(\w+)",
-        r"✅\s*(\w+)",
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, message_text or "")
-        if match:
-            return match.group(1)
+    match = _WINNER_RE.search(message_text or "")
+    if match:
+        return match.group(1) or match.group(2)
     return None
 
 
@@ -72,16 +73,19 @@ def register_pyro_table_tracker(app, group_id: int, admin_ids, *, database=None,
             return
         game_data = extract_game_data_from_message(message.text)
         if game_data:
-            _games[message.id] = game_data
+            with _games_lock:
+                _games[message.id] = game_data
 
     @app.on_edited_message(filters.chat(group_id) & filters.user(admin_ids) & filters.text)
     def on_admin_edit_message(client, message):
         if not message or not message.text:
             return
         winner = extract_winner_from_edited_message(message.text)
-        if winner and message.id in _games:
-            game_data = _games.pop(message.id)
-
+        if not winner:
+            return
+        with _games_lock:
+            game_data = _games.pop(message.id, None)
+        if game_data:
             # Announce in group
             client.send_message(
                 group_id,
@@ -91,17 +95,16 @@ def register_pyro_table_tracker(app, group_id: int, admin_ids, *, database=None,
             # Optional: credit winner and record transaction
             if database is not None:
                 try:
-                    winner_user = database.get_user_by_username(winner)
+                    winner_user = database.get_user_by_username(winner, projection={'_id': 0, 'user_id': 1})
                     if winner_user:
-                        new_balance = winner_user.get('balance', 0) + int(game_data['amount'])
-                        database.update_user_balance(winner_user['user_id'], new_balance)
+                        database.increment_user_balance(winner_user['user_id'], int(game_data['amount']))
 
                         tx = {
                             'user_id': winner_user['user_id'],
                             'type': 'win',
                             'amount': int(game_data['amount']),
                             'description': 'Game win',
-                            'timestamp': datetime.now(),
+                            'timestamp': datetime.utcnow(),
                         }
                         database.create_transaction(tx)
 
@@ -119,6 +122,7 @@ def register_pyro_table_tracker(app, group_id: int, admin_ids, *, database=None,
             # Optional: refresh pinned balance sheet
             if balance_sheet_manager is not None:
                 try:
-                    balance_sheet_manager.update_pinned_balance_sheet(group_id)
+                    # Sync handlers run in Pyrogram's worker threads; the edit must run on PTB's loop
+                    balance_sheet_manager.schedule_pinned_update(group_id)
                 except Exception:
                     pass
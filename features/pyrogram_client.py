@@ -6,6 +6,7 @@ Handles all Pyrogram operations including message handling, editing, and client
 
 import logging
 import asyncio
+import functools
 import re
 from datetime import datetime
 from pyrogram import Client
@@ -240,7 +241,7 @@ class PyrogramManager:
                 ],
                 'total_amount': amount * len(usernames),
                 'status': 'active',
-                'created_at': datetime.now()
+                'created_at': datetime.utcnow()
             }
             
             logger.info(f"🎮 Game data created: {game_id} with {len(usernames)} players, amount: {amount}")
@@ -310,12 +311,11 @@ class PyrogramManager:
         try:
             logger.info(f"🎮 Processing game result for {game_data['game_id']}, winner: {winner_username}")
             
-            # Find winner player data
-            winner_player = None
-            for player in game_data['players']:
-                if player['username'] == winner_username:
-                    winner_player = player
-                    break
+            # Find winner player data (games stored before players_by_username existed only have the list)
+            players_by_username = game_data.get('players_by_username') or {
+                player['username']: player for player in game_data['players']
+            }
+            winner_player = players_by_username.get(winner_username)
             
             if not winner_player:
                 logger.error(f"❌ Winner player not found: {winner_username}")
@@ -326,40 +326,56 @@ class PyrogramManager:
             winner_amount = total_amount * 0.8  # 80% to winner
             admin_fee = total_amount * 0.2      # 20% admin fee
             
-            # Update winner's balance
-            winner_user = self.database.get_user_by_username(winner_username)
-            if winner_user:
-                new_balance = winner_user['balance'] + winner_amount
-                self.database.update_user_balance(winner_user['user_id'], new_balance)
-                
-                # Record transaction
-                transaction_data = {
-                    'user_id': winner_user['user_id'],
-                    'type': 'win',
-                    'amount': winner_amount,
-                    'description': f'Game {game_data["game_id"]} - Winner',
-                    'timestamp': datetime.now(),
-                    'game_id': game_data['game_id']
-                }
-                self.database.create_transaction(transaction_data)
-                
-                # Notify winner
-                await self.pyro_client.send_message(
-                    chat_id=winner_user['user_id'],
-                    text=f"🎉 **Congratulations! You won!**\n\n"
-                         f"**Game:** {game_data['game_id']}\n"
-                         f"**Winnings:** ₹{winner_amount}\n"
-                         f"**New Balance:** ₹{new_balance}"
-                )
-            
-            # Update game status
-            self.database.update_game_status(
+            # The game status and balance writes go out concurrently on executor threads
+            loop = asyncio.get_running_loop()
+            status_write = loop.run_in_executor(None, functools.partial(
+                self.database.update_game_status,
                 game_data['game_id'], 
                 'completed', 
                 winner_username, 
                 winner_amount, 
                 admin_fee
-            )
+            ))
+            
+            try:
+                # Update winner's balance
+                winner_user = self.database.get_user_by_username(winner_username, projection={'_id': 0, 'user_id': 1})
+                if winner_user:
+                    balance_write = loop.run_in_executor(
+                        None, self.database.increment_user_balance, winner_user['user_id'], winner_amount
+                    )
+                    
+                    # Record transaction on this thread (its listeners touch loop-owned caches) while the others are in flight
+                    transaction_data = {
+                        'user_id': winner_user['user_id'],
+                        'type': 'win',
+                        'amount': winner_amount,
+                        'description': f'Game {game_data["game_id"]} - Winner',
+                        'timestamp': datetime.utcnow(),
+                        'game_id': game_data['game_id']
+                    }
+                    try:
+                        self.database.create_transaction(transaction_data)
+                    finally:
+                        updated = await balance_write
+                    if updated is None:
+                        # $inc matched no user document, so there is no real balance to report
+                        logger.error(f"❌ Balance not credited for {winner_username} in {game_data['game_id']}: user document not found")
+                    else:
+                        # Notify winner
+                        await self.pyro_client.send_message(
+                            chat_id=winner_user['user_id'],
+                            text=f"🎉 **Congratulations! You won!**\n\n"
+                                 f"**Game:** {game_data['game_id']}\n"
+                                 f"**Winnings:** ₹{winner_amount}\n"
+                                 f"**New Balance:** ₹{updated['balance']}"
+                        )
+            finally:
+                # Always settle the in-flight status write so its outcome is never lost
+                try:
+                    await status_write
+                except Exception as e:
+                    logger.error(f"❌ Error updating game status for {game_data['game_id']}: {e}")
             
             logger.info(f"✅ Game result processed successfully for {game_data['game_id']}")
             
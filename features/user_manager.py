@@ -26,7 +26,7 @@ class UserManager:
                 # Update last seen
                 self.database.users_collection.update_one(
                     {'user_id': user_id},
-                    {'$set': {'last_updated': datetime.now()}}
+                    {'$set': {'last_updated': datetime.utcnow()}}
                 )
                 logger.info(f"✅ User found: {username} (ID: {user_id})")
                 return user
@@ -43,7 +43,7 @@ class UserManager:
     def get_user_balance(self, user_id):
         """Get user's current balance"""
         try:
-            user = self.database.get_user(user_id)
+            user = self.database.get_user(user_id, projection={'_id': 0, 'balance': 1})
             if user:
                 return user.get('balance', 0)
             return 0
@@ -83,7 +83,7 @@ class UserManager:
                     'type': 'admin_add',
                     'amount': amount,
                     'description': f'{reason} (Admin: {admin_user_id})',
-                    'timestamp': datetime.now(),
+                    'timestamp': datetime.utcnow(),
                     'admin_user_id': admin_user_id
                 }
                 self.database.create_transaction(transaction_data)
@@ -115,7 +115,7 @@ class UserManager:
                     'type': 'withdraw',
                     'amount': -amount,  # Negative for withdrawal
                     'description': reason,
-                    'timestamp': datetime.now()
+                    'timestamp': datetime.utcnow()
                 }
                 self.database.create_transaction(transaction_data)
                 
@@ -214,7 +214,7 @@ class UserManager:
                 
                 # Count active users (updated in last 7 days)
                 if user.get('last_updated'):
-                    days_since_update = (datetime.now() - user['last_updated']).days
+                    days_since_update = (datetime.utcnow() - user['last_updated']).days
                     if days_since_update <= 7:
                         active_users += 1
                 
@@ -286,7 +286,7 @@ class UserManager:
     def cleanup_inactive_users(self, days_inactive=90):
         """Mark users as inactive if they haven't been active for N days"""
         try:
-            cutoff_date = datetime.now() - timedelta(days=days_inactive)
+            cutoff_date = datetime.utcnow() - timedelta(days=days_inactive)
             
             # Find inactive users
             inactive_users = self.database.users_collection.find({
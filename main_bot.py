@@ -212,8 +212,12 @@ class LudoBotManager:
             return
         
         # Expire old games
-        # Not supported in minimal tracker
-        message = "⏰ Expire games is not available in minimal tracker."
+        try:
+            expired = await asyncio.get_running_loop().run_in_executor(None, self.database.expire_old_games)
+            message = f"⏰ Expired {expired} old games."
+        except Exception as e:
+            logger.error(f"❌ Error expiring games: {e}")
+            message = "❌ Failed to expire old games."
         
         await update.message.reply_text(message)
     
@@ -335,14 +339,17 @@ class LudoBotManager:
     
     async def expire_old_games(self, context: ContextTypes.DEFAULT_TYPE):
         """Expire old games (scheduled job)"""
-        # Not applicable with minimal tracker
-        return
+        try:
+            # Blocking PyMongo update_many, kept off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, self.database.expire_old_games)
+        except Exception as e:
+            logger.error(f"❌ Error expiring old games: {e}")
     
     async def periodic_balance_sheet_update(self, context: ContextTypes.DEFAULT_TYPE):
         """Update pinned balance sheet (scheduled job)"""
         try:
             if self.balance_sheet_manager.pinned_balance_msg_id:
-                self.balance_sheet_manager.update_pinned_balance_sheet(self.group_id)
+                await self.balance_sheet_manager.update_pinned_balance_sheet(self.group_id)
         except Exception as e:
             logger.error(f"❌ Error updating balance sheet: {e}")
     
@@ -354,11 +361,16 @@ class LudoBotManager:
             except Exception as e:
                 logger.error(f"❌ Failed to start Pyrogram client: {e}")
     
+    async def _on_post_init(self, application):
+        """Runs on the application's event loop once it is initialized"""
+        # Pyrogram handlers run on other threads and schedule pinned sheet edits onto this loop
+        self.balance_sheet_manager.bind_loop(asyncio.get_running_loop())
+    
     def run(self):
         """Run the bot"""
         try:
             # Create application
-            self.application = Application.builder().token(self.bot_token).build()
+            self.application = Application.builder().token(self.bot_token).post_init(self._on_post_init).build()
             
             # Add handlers
             self.application.add_handler(CommandHandler("start", self.start_command))
@@ -390,7 +402,12 @@ class LudoBotManager:
             
             if job_queue:
                 # Schedule game expiration check every 5 minutes
-                # Disabled for minimal tracker
+                job_queue.run_repeating(
+                    callback=self.expire_old_games,
+                    interval=300,  # 5 minutes
+                    first=60,      # Start after 1 minute
+                    name="expire_old_games"
+                )
                 
                 # Schedule balance sheet update every 5 minutes
                 job_queue.run_repeating(